@@ -1,8 +1,12 @@
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import requests_cache
+from selectolax.lexbor import LexborHTMLParser
+import csv
 import time
 import random
+from datetime import timedelta
+import concurrent.futures
+import atexit
 
 # --- CONFIGURACIÓN ---
 # URL (URL de las categorias de la pagina)
@@ -14,65 +18,110 @@ HEADERS = {
     'Accept-Language': 'es-ES,es;q=0.9'
 }
 
+# Fichas de producto que se descargan en paralelo (no subir mucho para evitar bloqueos)
+MAX_WORKERS = 8
+
 DATOS_RECOPILADOS = []
+URLS_VISTAS = set() # URLs ya encoladas, para no entrar dos veces a la misma ficha
+
+# Sesión HTTP persistente: reutiliza la conexión TCP/TLS (Keep-Alive) entre peticiones
+# y guarda las respuestas en 'farmacia_cache.sqlite' (12 h) para que las re-ejecuciones no vuelvan a descargar
+session = requests_cache.CachedSession(
+    'farmacia_cache', backend='sqlite',
+    expire_after=timedelta(hours=12), allowable_codes=(200,)
+)
+session.headers.update(HEADERS)
+adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+session.mount('https://', adapter)
+
+# Un único pool de hilos para toda la ejecución: los mismos workers (y sus conexiones
+# Keep-Alive) se reutilizan en todas las páginas en vez de crear un pool por página
+pool_productos = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+atexit.register(pool_productos.shutdown)
 
 def obtener_sopa(url):
     try:
-        response = requests.get(url, headers=HEADERS, timeout=20)
+        response = session.get(url, timeout=20)
         if response.status_code == 200:
-            return BeautifulSoup(response.content, 'html.parser')
+            # selectolax con motor Lexbor (parser en C) es mucho más rápido que BeautifulSoup
+            return LexborHTMLParser(response.content)
     except Exception as e:
         print(f"❌ Error conectando a {url}: {e}")
     return None
 
+def siguiente_hermano(nodo):
+    """ Devuelve el siguiente elemento hermano, saltando textos y comentarios """
+    nodo = nodo.next
+    while nodo is not None and nodo.tag in ('-text', '-comment'):
+        nodo = nodo.next
+    return nodo
+
 def extraer_detalle_producto(url_producto):
     """ Entra a la ficha del producto para sacar composición y advertencias """
     soup = obtener_sopa(url_producto)
-    if not soup: return "No accesible", "No accesible"
+    if soup is None: return "No accesible", "No accesible"
     
     composicion = "No especificado"
     advertencias = "No especificado"
     
     # Buscamos títulos dentro de la descripción (H2, H3, H4 o Strong)
     # Esta parte busca palabras clave en el contenido
-    textos_clave = soup.find_all(['h2', 'h3', 'h4', 'strong', 'b'])
+    textos_clave = soup.css('h2, h3, h4, strong, b')
     
     for t in textos_clave:
-        texto = t.get_text(strip=True).lower()
+        texto = t.text(strip=True).lower()
         
         # Lógica para encontrar el texto que sigue al título
         if 'composición' in texto:
             # Buscamos el siguiente elemento que contenga texto
-            siguiente = t.find_next_sibling()
-            if siguiente: composicion = siguiente.get_text(strip=True)
+            siguiente = siguiente_hermano(t)
+            if siguiente: composicion = siguiente.text(strip=True)
             
         elif 'advertencias' in texto or 'contraindicaciones' in texto:
-            siguiente = t.find_next_sibling()
-            if siguiente: advertencias = siguiente.get_text(strip=True)
+            siguiente = siguiente_hermano(t)
+            if siguiente: advertencias = siguiente.text(strip=True)
             
     return composicion, advertencias
 
+def procesar_producto(datos):
+    """ Worker: entra a la ficha de un producto y completa sus datos """
+    try:
+        # Hacemos una pausa pequeña para no saturar
+        time.sleep(random.uniform(0.5, 1.0))
+        comp, adv = extraer_detalle_producto(datos['URL'])
+        
+        print(f"✅ {datos['Nombre'][:30]}... | {datos['Precio']}")
+        
+        return {
+            'Nombre': datos['Nombre'],
+            'Precio': datos['Precio'],
+            'Composición': comp,
+            'Info Importante': adv,
+            'URL': datos['URL']
+        }
+        
+    except Exception as e:
+        print(f"⚠️ Error en un producto: {e}")
+        return None
+
 def escanear_catalogo():
     page = 1
     # ⚠️ IMPORTANTE: Pon aquí cuántas páginas quieres escanear (ej. 5). 
     # Si pones 100, tardará bastante.
     MAX_PAGES = 11
     
+    url_actual = BASE_URL
+    futuro_pagina = None # Descarga adelantada de la página siguiente
+    
     while page <= MAX_PAGES:
-        # Construcción de la URL de paginación
-        if page == 1:
-            url_actual = BASE_URL
-        else:
-            url_actual = f"{BASE_URL}page/{page}/"
-            
         print(f"\n--- 📄 PROCESANDO PÁGINA {page} ---")
-        soup = obtener_sopa(url_actual)
+        soup = futuro_pagina.result() if futuro_pagina else obtener_sopa(url_actual)
         
-        if not soup: break
+        if soup is None: break
         
         # --- SELECTOR MAESTRO ---
         # Buscamos 'div' que tenga la clase 'wd-product'
-        productos = soup.select('div.wd-product')
+        productos = soup.css('div.wd-product')
         
         if not productos:
             print("🛑 No se encontraron más productos. Fin del escaneo.")
@@ -80,42 +129,47 @@ def escanear_catalogo():
             
         print(f"🔍 Encontrados {len(productos)} productos. Extrayendo datos...")
         
+        tareas = []
         for prod in productos:
             try:
                 # 1. TÍTULO Y LINK 
                 # Buscamos la clase 'wd-entities-title'
-                tag_titulo = prod.select_one('.wd-entities-title a')
+                tag_titulo = prod.css_first('.wd-entities-title a')
                 
                 if not tag_titulo: continue # Si no tiene título, saltamos
                 
-                nombre = tag_titulo.get_text(strip=True)
-                link = tag_titulo['href']
+                # Si el producto ya salió en otra página, no volvemos a entrar a su ficha
+                link = tag_titulo.attributes['href']
+                if link in URLS_VISTAS: continue
+                URLS_VISTAS.add(link)
                 
                 # 2. PRECIO
                 # Buscamos la clase 'price'
-                tag_precio = prod.select_one('.price')
-                precio = tag_precio.get_text(strip=True) if tag_precio else "Agotado/Sin precio"
+                tag_precio = prod.css_first('.price')
                 
-                # 3. EXTRAER DETALLES (Entrando al link)
-                # Hacemos una pausa pequeña para no saturar
-                time.sleep(random.uniform(0.5, 1.0))
-                comp, adv = extraer_detalle_producto(link)
-                
-                # Guardar en memoria
-                DATOS_RECOPILADOS.append({
-                    'Nombre': nombre,
-                    'Precio': precio,
-                    'Composición': comp,
-                    'Info Importante': adv,
+                tareas.append({
+                    'Nombre': tag_titulo.text(strip=True),
+                    'Precio': tag_precio.text(strip=True) if tag_precio else "Agotado/Sin precio",
                     'URL': link
                 })
                 
-                print(f"✅ {nombre[:30]}... | {precio}")
-                
             except Exception as e:
                 print(f"⚠️ Error en un producto: {e}")
                 continue
         
+        # Solo pedimos otra página si el sitio enlaza una siguiente (evita un fetch inútil al final)
+        siguiente = soup.css_first('a.next, .next a')
+        futuro_pagina = None
+        if siguiente is not None and page < MAX_PAGES:
+            # Construcción de la URL de paginación (usamos el enlace tal cual si lo trae)
+            url_actual = siguiente.attributes.get('href') or f"{BASE_URL}page/{page + 1}/"
+            # Se encola antes que las fichas: la página siguiente se descarga mientras se procesan
+            futuro_pagina = pool_productos.submit(obtener_sopa, url_actual)
+        
+        # 3. EXTRAER DETALLES (Entrando a cada link en paralelo)
+        DATOS_RECOPILADOS.extend(filter(None, pool_productos.map(procesar_producto, tareas)))
+        
+        if futuro_pagina is None: break
         page += 1
 
 # --- EJECUCIÓN ---
@@ -124,9 +178,12 @@ escanear_catalogo()
 
 # --- GUARDADO ---
 if DATOS_RECOPILADOS:
-    df = pd.DataFrame(DATOS_RECOPILADOS)
     nombre_archivo = 'reporte_farmacia_final.csv'
-    df.to_csv(nombre_archivo, index=False, encoding='utf-8-sig')
+    # csv.DictWriter escribe la lista de diccionarios directamente, sin pasar por pandas
+    with open(nombre_archivo, 'w', encoding='utf-8-sig', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=['Nombre', 'Precio', 'Composición', 'Info Importante', 'URL'])
+        w.writeheader()
+        w.writerows(DATOS_RECOPILADOS)
     print(f"\n🎉 ¡ÉXITO! Se generó el archivo '{nombre_archivo}' con {len(DATOS_RECOPILADOS)} productos.")
 else:
     print("\nNo se pudieron extraer datos. Revisa tu conexión.")
\ No newline at end of file
@@ -1,8 +1,12 @@
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import requests_cache
+from selectolax.lexbor import LexborHTMLParser
+from openpyxl import Workbook
 import time
 import random
+from datetime import timedelta
+import concurrent.futures
+import atexit
 
 # --- CONFIGURACIÓN ---
 BASE_URL = "https://www.hogarysalud.com.pe/c/nutricion/"
@@ -11,13 +15,33 @@ HEADERS = {
     'Accept-Language': 'es-ES,es;q=0.9'
 }
 
+# Fichas de producto que se descargan en paralelo (no subir mucho para evitar bloqueos)
+MAX_WORKERS = 8
+
 DATOS_RECOPILADOS = []
+URLS_VISTAS = set() # URLs ya encoladas, para no entrar dos veces a la misma ficha
+
+# Sesión HTTP persistente: reutiliza la conexión TCP/TLS (Keep-Alive) entre peticiones
+# y guarda las respuestas en 'farmacia_cache.sqlite' (12 h) para que las re-ejecuciones no vuelvan a descargar
+session = requests_cache.CachedSession(
+    'farmacia_cache', backend='sqlite',
+    expire_after=timedelta(hours=12), allowable_codes=(200,)
+)
+session.headers.update(HEADERS)
+adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+session.mount('https://', adapter)
+
+# Un único pool de hilos para toda la ejecución: los mismos workers (y sus conexiones
+# Keep-Alive) se reutilizan en todas las páginas en vez de crear un pool por página
+pool_productos = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+atexit.register(pool_productos.shutdown)
 
 def obtener_sopa(url):
     try:
-        response = requests.get(url, headers=HEADERS, timeout=20)
+        response = session.get(url, timeout=20)
         if response.status_code == 200:
-            return BeautifulSoup(response.content, 'html.parser')
+            # selectolax con motor Lexbor (parser en C) es mucho más rápido que BeautifulSoup
+            return LexborHTMLParser(response.content)
     except Exception as e:
         print(f"❌ Error conectando a {url}: {e}")
     return None
@@ -30,25 +54,25 @@ def extraer_info_acordeon(url_producto):
     soup = obtener_sopa(url_producto)
     info_extra = {} # Diccionario vacío para guardar lo que encontremos
     
-    if not soup: return info_extra
+    if soup is None: return info_extra
     
     # 1. Buscamos cada bloque del acordeón
-    items_acordeon = soup.select('div.wd-accordion-item')
+    items_acordeon = soup.css('div.wd-accordion-item')
     
     for item in items_acordeon:
         try:
             # 2. Extraer el Título (Composición, Advertencias, etc.)
-            titulo_tag = item.select_one('.wd-accordion-title-text')
+            titulo_tag = item.css_first('.wd-accordion-title-text')
             if not titulo_tag: continue
             
-            titulo_texto = titulo_tag.get_text(strip=True)
+            titulo_texto = titulo_tag.text(strip=True)
             
             # 3. Extraer el Contenido (El texto oculto)
-            contenido_tag = item.select_one('.woocommerce-Tabs-panel')
+            contenido_tag = item.css_first('.woocommerce-Tabs-panel')
             
             if contenido_tag:
                 # Usamos separator=' ' para que los párrafos no se peguen
-                contenido_texto = contenido_tag.get_text(separator=' ', strip=True)
+                contenido_texto = contenido_tag.text(separator=' ', strip=True)
                 
                 # Guardamos en el diccionario: Clave = Título, Valor = Texto
                 info_extra[titulo_texto] = contenido_texto
@@ -58,60 +82,80 @@ def extraer_info_acordeon(url_producto):
             
     return info_extra
 
+def procesar_producto(item_final):
+    """ Worker: completa los datos básicos de un producto con su acordeón """
+    try:
+        # --- AQUÍ LA MAGIA: Extraer datos dinámicos ---
+        # Entramos al link y traemos el diccionario con todo lo que haya
+        diccionario_info = extraer_info_acordeon(item_final['URL'])
+        
+        # Fusionamos el diccionario de info extra (Advertencias, Composición, etc.)
+        item_final.update(diccionario_info)
+        
+        print(f"✅ {item_final['Nombre'][:30]}... | Info extraída: {list(diccionario_info.keys())}")
+        
+        time.sleep(random.uniform(0.5, 1.2)) # Pausa de cortesía
+        return item_final
+        
+    except Exception as e:
+        print(f"⚠️ Error: {e}")
+        return None
+
 def escanear_catalogo():
     page = 1
     MAX_PAGES = 11 # Aumenta esto cuando quieras todo el catálogo
     
+    url = BASE_URL
+    futuro_pagina = None # Descarga adelantada de la página siguiente
+    
     while page <= MAX_PAGES:
-        if page == 1: url = BASE_URL
-        else: url = f"{BASE_URL}page/{page}/"
-            
         print(f"\n--- 📄 PROCESANDO PÁGINA {page} ---")
-        soup = obtener_sopa(url)
-        if not soup: break
+        soup = futuro_pagina.result() if futuro_pagina else obtener_sopa(url)
+        if soup is None: break
         
         # Selector de productos (Confirmado que funciona)
-        productos = soup.select('div.wd-product')
+        productos = soup.css('div.wd-product')
         if not productos: break
             
         print(f"🔍 Encontrados {len(productos)} productos...")
         
+        tareas = []
         for prod in productos:
             try:
                 # Datos básicos
-                tag_titulo = prod.select_one('.wd-entities-title a')
+                tag_titulo = prod.css_first('.wd-entities-title a')
                 if not tag_titulo: continue
                 
-                nombre = tag_titulo.get_text(strip=True)
-                link = tag_titulo['href']
+                # Si el producto ya salió en otra página, no volvemos a entrar a su ficha
+                link = tag_titulo.attributes['href']
+                if link in URLS_VISTAS: continue
+                URLS_VISTAS.add(link)
                 
-                tag_precio = prod.select_one('.price')
-                # Limpieza de precio para que Excel lo entienda mejor
-                precio = tag_precio.get_text(separator=' ', strip=True) if tag_precio else "0"
+                tag_precio = prod.css_first('.price')
                 
-                # --- AQUÍ LA MAGIA: Extraer datos dinámicos ---
-                # Entramos al link y traemos el diccionario con todo lo que haya
-                diccionario_info = extraer_info_acordeon(link)
-                
-                # Creamos el objeto final fusionando datos básicos + datos del acordeón
-                item_final = {
-                    'Nombre': nombre,
-                    'Precio': precio,
+                tareas.append({
+                    'Nombre': tag_titulo.text(strip=True),
+                    # Limpieza de precio para que Excel lo entienda mejor
+                    'Precio': tag_precio.text(separator=' ', strip=True) if tag_precio else "0",
                     'URL': link
-                }
-                # Fusionamos el diccionario de info extra (Advertencias, Composición, etc.)
-                item_final.update(diccionario_info)
-                
-                DATOS_RECOPILADOS.append(item_final)
-                
-                print(f"✅ {nombre[:30]}... | Info extraída: {list(diccionario_info.keys())}")
-                
-                time.sleep(random.uniform(0.5, 1.2)) # Pausa de cortesía
+                })
                 
             except Exception as e:
                 print(f"⚠️ Error: {e}")
                 continue
         
+        # Solo pedimos otra página si el sitio enlaza una siguiente (evita un fetch inútil al final)
+        siguiente = soup.css_first('a.next, .next a')
+        futuro_pagina = None
+        if siguiente is not None and page < MAX_PAGES:
+            url = siguiente.attributes.get('href') or f"{BASE_URL}page/{page + 1}/"
+            # Se encola antes que las fichas: la página siguiente se descarga mientras se procesan
+            futuro_pagina = pool_productos.submit(obtener_sopa, url)
+        
+        # Las fichas se descargan en paralelo; el orden del catálogo se conserva
+        DATOS_RECOPILADOS.extend(filter(None, pool_productos.map(procesar_producto, tareas)))
+        
+        if futuro_pagina is None: break
         page += 1
 
 # --- EJECUCIÓN ---
@@ -120,11 +164,17 @@ escanear_catalogo()
 
 # --- GUARDADO EN EXCEL (.xlsx) ---
 if DATOS_RECOPILADOS:
-    df = pd.DataFrame(DATOS_RECOPILADOS)
+    # Las columnas del acordeón varían entre productos: las tomamos en orden de aparición
+    columnas = list(dict.fromkeys(k for item in DATOS_RECOPILADOS for k in item))
     
-    # Esto guardará directamente en formato Excel con celdas separadas
+    # Modo write-only: las filas se vuelcan al archivo sin armar todo el libro en memoria
     nombre_archivo = 'catalogo_completo_dinamico.xlsx'
-    df.to_excel(nombre_archivo, index=False)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(columnas)
+    for item in DATOS_RECOPILADOS:
+        ws.append([item.get(k) for k in columnas])
+    wb.save(nombre_archivo)
     
     print(f"\n🎉 ¡ÉXITO! Se generó '{nombre_archivo}'.")
     print("Nota: Las columnas se crearon automáticamente según la info encontrada.")
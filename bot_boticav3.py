@@ -1,11 +1,19 @@
-import requests
-import pandas as pd
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import sys
 import time
-import random
-import unicodedata
+from datetime import datetime, timedelta
 import re
 import concurrent.futures
-from bs4 import BeautifulSoup
+import threading
+import queue
+import pickle
+import xlsxwriter
+from selectolax.lexbor import LexborHTMLParser
+
+# Normalización y búsqueda MINSA (módulo compilable con mypyc, ver filtro.py)
+from filtro import normalizar, construir_automata, cumple_filtro
 
 
 # ==============================================================================
@@ -29,50 +37,123 @@ HEADERS = {
 # Se recomienda mantener entre 5 y 10 para no saturar el servidor destino
 MAX_WORKERS = 5
 
+# Máximo de peticiones HTTP en vuelo (categorías + productos). Limita el semáforo
+# y dimensiona el pool de conexiones, así cada petición tiene su conexión Keep-Alive
+MAX_PETICIONES = MAX_WORKERS
+
+# Ritmo de descarga de fichas de producto (token bucket):
+# TASA_PETICIONES por segundo de media, con ráfagas de hasta RAFAGA_PETICIONES
+TASA_PETICIONES = 4
+RAFAGA_PETICIONES = 8
+
+# Modo incremental (ejecutar con '--incremental'): las URLs cuya ficha se descargó bien
+# se guardan en ARCHIVO_VISTAS al terminar y se cargan al iniciar, así una re-ejecución
+# solo entra a productos nuevos. Los productos nuevos se escriben en un Excel aparte
+# con fecha y hora, sin tocar el reporte completo.
+ARCHIVO_VISTAS = "seen.pkl"
+
+# Columnas del Excel de salida, en orden
+COLUMNAS = [
+    'Categoría', 'Nombre', 'Precio Mínimo (S/)', 'Precio Máximo (S/)', 'URL',
+    'Registro Sanitario', 'Composición', 'Descripción', 'Advertencias', 'Contraindicaciones'
+]
+
+# Regex precompilada para capturar números con formato decimal (ej: 14.50)
+PATRON_PRECIO = re.compile(r'\d+\.\d{2}')
+
+# Clasificación de títulos de acordeón: un solo recorrido regex por título
+# y un diccionario que traduce cada raíz encontrada al campo de salida
+PATRON_TITULO = re.compile(r'descripci|advertencia|contraindicaci|composici')
+MAP_TITULOS = {
+    'descripci': 'Descripción', 
+    'advertencia': 'Advertencias', 
+    'contraindicaci': 'Contraindicaciones', 
+    'composici': 'Composición'
+}
+
 # Estructuras de datos globales para almacenamiento en memoria
 lista_minsa = set()          # Conjunto para búsqueda rápida O(1) de medicamentos
-datos_recopilados = []       # Lista para almacenar los diccionarios de productos encontrados
+cola_resultados = queue.Queue() # Productos validados pendientes de escribir en el Excel
+total_guardados = 0          # Filas escritas por el hilo escritor
+error_escritor = None        # Excepción del hilo escritor, se relanza en el hilo principal
 URLS_VISTAS = set()          # Set para registrar URLs y evitar procesar duplicados en tiempo real
+URLS_PROCESADAS = set()      # URLs cuya ficha se descargó correctamente (se persisten en modo incremental)
+lock_urls = threading.Lock() # Protege URLS_VISTAS y URLS_PROCESADAS: varias categorías se procesan a la vez
+detener = threading.Event()  # Se activa ante Ctrl+C o un error: categorías y workers dejan de trabajar
+
+# Pool de hilos compartido por todas las categorías para el Deep Scraping de productos
+pool_productos = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
 # Configuración de la sesión HTTP persistente
-# Permite reutilizar la conexión TCP (Keep-Alive) para mayor velocidad
-session = requests.Session()
+# Permite reutilizar la conexión TCP (Keep-Alive) para mayor velocidad.
+# Las respuestas se guardan en 'farmacia_cache.sqlite' durante 12 horas, así las
+# re-ejecuciones (ajustes de filtro, lista MINSA actualizada) no vuelven a descargar.
+# Ejecutar con '--fresh' para vaciar la caché y descargar todo de nuevo.
+session = requests_cache.CachedSession(
+    'farmacia_cache', backend='sqlite',
+    expire_after=timedelta(hours=12), allowable_codes=(200,)
+)
 session.headers.update(HEADERS)
 
+# Reintentos con espera exponencial ante errores temporales o límites de tasa (429),
+# respetando la cabecera 'Retry-After' que envíe el servidor
+reintentos = Retry(
+    total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True, raise_on_status=False
+)
+adaptador = HTTPAdapter(pool_maxsize=MAX_PETICIONES, max_retries=reintentos)
+session.mount('https://', adaptador)
+session.mount('http://', adaptador)
+
+# Máximo de peticiones en vuelo, compartido por los hilos de categorías y de productos
+limite_peticiones = threading.Semaphore(MAX_PETICIONES)
+
 
 # ==============================================================================
 # SECCIÓN 2: FUNCIONES DE UTILIDAD Y NORMALIZACIÓN
 # ==============================================================================
 
-def normalizar(txt):
+class LimitadorTokens:
     """
-    Normaliza una cadena de texto para facilitar comparaciones insensibles a formato.
-    
-    Proceso:
-    1. Convierte todo el texto a mayúsculas.
-    2. Elimina acentos y diacríticos (ej: Á -> A, ñ -> n).
+    Limitador de tasa tipo 'token bucket', compartido por todos los hilos.
     
-    Args:
-        txt (str): Texto original.
-        
-    Returns:
-        str: Texto limpio y normalizado.
+    Se recargan 'tasa' tokens por segundo hasta un máximo de 'capacidad'.
+    Cada petición consume uno; si no quedan, el hilo espera solo lo necesario
+    hasta la siguiente recarga. Por debajo del límite no hay ninguna espera.
     """
-    # Validación preventiva: si no es texto, retornar cadena vacía
-    if not isinstance(txt, str): 
-        return ""
     
-    # Normalización Unicode NFD para separar caracteres base de sus acentos
-    texto_normalizado = unicodedata.normalize('NFD', txt.upper())
+    def __init__(self, tasa, capacidad):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
     
-    # Filtrado de caracteres: nos quedamos solo con los que NO son marcas diacríticas ('Mn')
-    return ''.join(c for c in texto_normalizado if unicodedata.category(c) != 'Mn')
+    def tomar(self):
+        """Consume un token, esperando si el cubo está vacío."""
+        with self.lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            
+            # El token se reserva aunque el saldo quede negativo: así los hilos
+            # que llegan después esperan su turno en orden
+            self.tokens -= 1
+            espera = -self.tokens / self.tasa if self.tokens < 0 else 0
+        
+        # La espera se hace fuera del lock para no bloquear al resto de hilos
+        if espera:
+            time.sleep(espera)
+
+
+limitador = LimitadorTokens(TASA_PETICIONES, RAFAGA_PETICIONES)
 
 
 def cargar_filtro():
     """
     Lee el archivo de texto local y carga los medicamentos en memoria.
-    Utiliza un 'Set' (conjunto) para optimizar la velocidad de búsqueda.
+    Utiliza un 'Set' (conjunto) para eliminar duplicados y compila todos los
+    medicamentos en un autómata Aho-Corasick para la búsqueda.
     """
     try:
         print(f"📖 Leyendo archivo de filtro: {FILE_MINSA}...")
@@ -80,9 +161,16 @@ def cargar_filtro():
         with open(FILE_MINSA, 'r', encoding='utf-8') as f:
             global lista_minsa
             
-            # Comprensión de conjuntos para cargar y limpiar en una sola pasada
-            # Filtramos líneas menores a 3 caracteres para evitar ruido
-            lista_minsa = {normalizar(line.strip()) for line in f if len(line.strip()) > 3}
+            # Se lee y normaliza el archivo completo de una vez (una sola pasada en C)
+            # en lugar de normalizar línea por línea
+            texto = normalizar(f.read())
+            
+        # Comprensión de conjuntos para separar y limpiar en una sola pasada
+        # Filtramos líneas menores a 3 caracteres para evitar ruido
+        lineas = (line.strip() for line in texto.splitlines())
+        lista_minsa = {line for line in lineas if len(line) > 3}
+            
+        construir_automata(lista_minsa)
             
         print(f"✅ Filtro cargado exitosamente: {len(lista_minsa)} medicamentos listos.")
         
@@ -91,31 +179,29 @@ def cargar_filtro():
         print("   Por favor, asegúrate de que el archivo existe en la carpeta del script.")
 
 
-def cumple_filtro(nombre):
+def cargar_vistas():
     """
-    Determina si un producto de la web coincide con la lista del MINSA.
-    
-    Args:
-        nombre (str): Nombre del producto extraído de la web.
-        
-    Returns:
-        bool: True si hay coincidencia, False en caso contrario.
+    Modo incremental: recupera las URLs procesadas en ejecuciones anteriores.
     """
-    # Normalizamos el nombre que viene de la web
-    n = normalizar(nombre)
-    
-    # Iteramos sobre la lista segura para buscar coincidencias
-    # Se verifica: coincidencia exacta O palabra contenida con espacios (para evitar falsos positivos)
-    for m in lista_minsa:
-        
-        condicion_exacta = (m == n)
-        condicion_contenido = (f" {m} " in f" {n} ")
-        condicion_inicio = n.startswith(f"{m} ")
-        
-        if condicion_exacta or condicion_contenido or condicion_inicio:
-            return True
-            
-    return False
+    try:
+        with open(ARCHIVO_VISTAS, 'rb') as f:
+            vistas = pickle.load(f)
+        URLS_VISTAS.update(vistas)
+        URLS_PROCESADAS.update(vistas)
+        print(f"♻️ Modo incremental: {len(URLS_VISTAS)} URLs ya procesadas se omitirán.")
+    except FileNotFoundError:
+        pass
+
+
+def guardar_vistas():
+    """
+    Modo incremental: guarda en disco las URLs cuya ficha se descargó correctamente.
+    Las que fallaron (error de red, etc.) no se guardan y se reintentan en la próxima ejecución.
+    """
+    with lock_urls:
+        vistas = set(URLS_PROCESADAS)
+    with open(ARCHIVO_VISTAS, 'wb') as f:
+        pickle.dump(vistas, f)
 
 
 def get_precios(txt):
@@ -132,13 +218,23 @@ def get_precios(txt):
     if not txt:
         return 0.0, 0.0
         
-    # Regex para capturar números con formato decimal (ej: 14.50)
-    vals = [float(x) for x in re.findall(r'(\d+\.\d{2})', txt)]
+    coincidencias = PATRON_PRECIO.finditer(txt)
+    primera = next(coincidencias, None)
     
-    if vals:
-        return min(vals), max(vals)
-    else:
+    if primera is None:
         return 0.0, 0.0
+    
+    # Mínimo y máximo en una sola pasada, sin armar listas intermedias
+    # (en el caso más común, un único precio, el bucle no llega a ejecutarse)
+    p_min = p_max = float(primera.group())
+    for m in coincidencias:
+        v = float(m.group())
+        if v < p_min:
+            p_min = v
+        elif v > p_max:
+            p_max = v
+    
+    return p_min, p_max
 
 
 def get_soup(url):
@@ -149,14 +245,23 @@ def get_soup(url):
         url (str): URL a consultar.
         
     Returns:
-        BeautifulSoup object | None: Objeto parseado o None si falló.
+        LexborHTMLParser | None: Árbol parseado (selectolax, motor Lexbor) o None si falló.
     """
     try:
-        # Timeout de 20 segundos para evitar bloqueos infinitos
-        r = session.get(url, timeout=20)
+        with limite_peticiones:
+            # Timeout de 20 segundos para evitar bloqueos infinitos
+            r = session.get(url, timeout=20)
+            
+            # Si el servidor sigue limitando tras los reintentos, respetamos su pausa
+            # antes de liberar el cupo para que los demás hilos también frenen
+            if r.status_code == 429:
+                espera = r.headers.get('Retry-After', '')
+                time.sleep(int(espera) if espera.isdigit() else 5)
         
         if r.status_code == 200:
-            return BeautifulSoup(r.content, 'html.parser')
+            # selectolax con el motor Lexbor: parser HTML5 en C con motor CSS propio,
+            # más rápido que el backend Modest y que BeautifulSoup
+            return LexborHTMLParser(r.content)
         else:
             return None
             
@@ -171,27 +276,25 @@ def get_soup(url):
 
 def procesar_producto(data):
     """
-    Función Worker: Procesa un único producto.
-    1. Verifica si cumple el filtro MINSA.
-    2. Si cumple, entra a la URL (Deep Scraping).
-    3. Extrae detalles técnicos (Registro, Composición, etc.).
+    Función Worker: Procesa un único producto que ya pasó el filtro MINSA.
+    1. Entra a la URL (Deep Scraping).
+    2. Extrae detalles técnicos (Registro, Composición, etc.).
     
     Args:
         data (dict): Datos básicos del producto (Nombre, URL, Precio).
         
     Returns:
-        dict | None: Datos enriquecidos o None si fue descartado.
+        dict: Datos enriquecidos.
     """
     
-    # --- PASO 1: FILTRADO PREVIO ---
-    # Si el nombre no está en la lista MINSA, abortamos para ahorrar recursos
-    if not cumple_filtro(data['Nombre']): 
+    # Ejecución interrumpida: no se descargan más fichas
+    if detener.is_set():
         return None
     
-    # Pequeña pausa aleatoria para comportamiento humano
-    time.sleep(random.uniform(0.1, 0.5))
+    # Respetamos el ritmo máximo de peticiones (solo espera si se supera)
+    limitador.tomar()
     
-    # --- PASO 2: EXTRACCIÓN PROFUNDA ---
+    # --- EXTRACCIÓN PROFUNDA ---
     soup = get_soup(data['URL'])
     
     # Diccionario por defecto para campos que podrían no existir
@@ -203,53 +306,105 @@ def procesar_producto(data):
         'Contraindicaciones': 'No especificado'
     }
     
-    if soup:
+    if soup is not None:
         
-        # A. Búsqueda en Acordeones (Pestañas desplegables)
-        # -------------------------------------------------
-        map_titles = {
-            'descripci': 'Descripción', 
-            'advertencia': 'Advertencias', 
-            'contraindicaci': 'Contraindicaciones', 
-            'composici': 'Composición'
-        }
+        # Ficha descargada: el escritor la marcará como procesada al guardarla
+        data['ficha_descargada'] = True
         
-        for item in soup.select('div.wd-accordion-item'):
-            t = item.select_one('.wd-accordion-title-text')
-            c = item.select_one('.woocommerce-Tabs-panel')
+        # Un solo recorrido del árbol para acordeones y tabla de atributos.
+        # El acordeón siempre sobrescribe la Composición, así que el orden en que
+        # aparezcan los nodos no cambia el resultado.
+        for nodo in soup.css('div.wd-accordion-item, tr.woocommerce-product-attributes-item'):
             
-            if t and c:
-                txt_t = t.get_text(strip=True).lower()
+            # A. Acordeones (Pestañas desplegables)
+            # -------------------------------------------------
+            if nodo.tag == 'div':
+                t = nodo.css_first('.wd-accordion-title-text')
+                c = nodo.css_first('.woocommerce-Tabs-panel')
                 
-                # Asignación dinámica según el título del acordeón
-                for key, val in map_titles.items():
-                    if key in txt_t: 
-                        info[val] = c.get_text(separator=' ', strip=True)
-
-        # B. Búsqueda en Tabla de Atributos (Info Técnica)
-        # -------------------------------------------------
-        for row in soup.select('tr.woocommerce-product-attributes-item'):
-            th = row.select_one('th')
-            td = row.select_one('td')
+                if t and c:
+                    txt_t = t.text(strip=True).lower()
+                    
+                    # Asignación dinámica según el título del acordeón.
+                    # Un mismo título puede llenar varios campos (ej: "Advertencias y contraindicaciones")
+                    for raiz in set(PATRON_TITULO.findall(txt_t)):
+                        info[MAP_TITULOS[raiz]] = c.text(separator=' ', strip=True)
             
-            if th and td:
-                lbl = th.get_text(strip=True).lower()
-                val = td.get_text(strip=True)
+            # B. Tabla de Atributos (Info Técnica)
+            # -------------------------------------------------
+            else:
+                th = nodo.css_first('th')
+                td = nodo.css_first('td')
                 
-                # Extracción específica de Registro Sanitario
-                if 'registro' in lbl: 
-                    info['Registro Sanitario'] = val
+                if th and td:
+                    lbl = th.text(strip=True).lower()
+                    val = td.text(strip=True)
                     
-                # Respaldo para Composición si no se encontró en acordeones
-                elif 'composici' in lbl and info['Composición'] == 'No especificado': 
-                    info['Composición'] = val
+                    # Extracción específica de Registro Sanitario
+                    if 'registro' in lbl: 
+                        info['Registro Sanitario'] = val
+                        
+                    # Respaldo para Composición si no se encontró en acordeones
+                    elif 'composici' in lbl and info['Composición'] == 'No especificado': 
+                        info['Composición'] = val
 
     # Fusionamos los datos extraídos con los datos base
     data.update(info)
     
+    # Se entrega al hilo escritor, que lo vuelca al Excel de inmediato
+    cola_resultados.put(data)
+    
     return data
 
 
+def escritor_excel(nombre_excel):
+    """
+    Hilo Escritor: único consumidor de 'cola_resultados'.
+    Vuelca cada producto al Excel (xlsxwriter con constant_memory) según van llegando:
+    solo la fila actual se mantiene en memoria. Termina al recibir None.
+    Si algo falla, la excepción queda en 'error_escritor' para el hilo principal.
+    
+    Args:
+        nombre_excel (str): Ruta del archivo de salida.
+    """
+    global total_guardados, error_escritor
+    
+    wb = None
+    
+    try:
+        while True:
+            fila = cola_resultados.get()
+            if fila is None:
+                break
+            
+            # El libro se crea con el primer producto: sin resultados no se genera archivo.
+            # Las URLs se guardan como texto plano (como antes), no como hipervínculos
+            if wb is None:
+                wb = xlsxwriter.Workbook(nombre_excel, {'constant_memory': True, 'strings_to_urls': False})
+                ws = wb.add_worksheet()
+                ws.write_row(0, 0, COLUMNAS)
+            
+            total_guardados += 1
+            ws.write_row(total_guardados, 0, [fila.get(k) for k in COLUMNAS])
+            
+            # Solo las fichas descargadas y ya escritas cuentan como procesadas (modo incremental)
+            if fila.get('ficha_descargada'):
+                with lock_urls:
+                    URLS_PROCESADAS.add(fila['URL'])
+    
+    except Exception as e:
+        error_escritor = e
+    
+    finally:
+        # Se intenta guardar lo escrito aunque haya fallado una fila
+        # (ej: PermissionError si el Excel anterior sigue abierto)
+        if wb is not None:
+            try:
+                wb.close()
+            except Exception as e:
+                error_escritor = error_escritor or e
+
+
 # ==============================================================================
 # SECCIÓN 4: GESTOR DE CATEGORÍAS Y PAGINACIÓN (MANAGER)
 # ==============================================================================
@@ -257,7 +412,8 @@ def procesar_producto(data):
 def procesar_categoria(url):
     """
     Itera sobre todas las páginas de una categoría específica.
-    Recolecta productos y delega el procesamiento detallado a los Workers.
+    Recolecta productos y delega el procesamiento detallado a los Workers
+    sin esperarlos: la paginación avanza mientras los Workers trabajan.
     
     Args:
         url (str): URL de la categoría a procesar.
@@ -269,19 +425,19 @@ def procesar_categoria(url):
     print("   Iniciando secuencia de paginación...")
     
     page = 1
+    current_url = url
+    futuros = []  # Tareas enviadas al pool desde todas las páginas de la categoría
     
-    while page <= 100: # Límite de seguridad
+    while page <= 100 and not detener.is_set(): # Límite de seguridad / ejecución interrumpida
         
-        # Construcción de URL paginada
-        current_url = f"{url}page/{page}/" if page > 1 else url
         soup = get_soup(current_url)
         
         # Si no carga la página, asumimos fin de categoría
-        if not soup: 
+        if soup is None: 
             break
         
         # Selector de productos en la rejilla
-        prods = soup.select('div.wd-product')
+        prods = soup.css('div.wd-product')
         
         if not prods: 
             break
@@ -290,34 +446,45 @@ def procesar_categoria(url):
         tareas = []
         
         for p in prods:
-            tag_a = p.select_one('.wd-entities-title a')
+            tag_a = p.css_first('.wd-entities-title a')
             
             # Validación básica de integridad HTML
             if not tag_a: 
                 continue
             
-            url_prod = tag_a['href']
+            nombre = tag_a.text(strip=True)
+            
+            # -------------------------------------------------------
+            # [OPTIMIZACIÓN] FILTRO MINSA ANTES DE ENCOLAR
+            # -------------------------------------------------------
+            # Los productos que no están en la lista MINSA nunca llegan
+            # al pool: los workers solo reciben descargas reales.
+            if not cumple_filtro(normalizar(nombre)):
+                continue
+            
+            url_prod = tag_a.attributes['href']
             
             # -------------------------------------------------------
             # [OPTIMIZACIÓN] FILTRO DE DUPLICADOS EN TIEMPO REAL
             # -------------------------------------------------------
             # Si la URL ya está en nuestro set 'URLS_VISTAS', significa
             # que este producto ya apareció en otra categoría. Lo saltamos.
-            if url_prod in URLS_VISTAS:
-                continue
-            
-            # Si es nuevo, lo registramos para futuras comparaciones
-            URLS_VISTAS.add(url_prod)
+            with lock_urls:
+                if url_prod in URLS_VISTAS:
+                    continue
+                
+                # Si es nuevo, lo registramos para futuras comparaciones
+                URLS_VISTAS.add(url_prod)
             
             # Extracción de precios
-            tag_price = p.select_one('.price')
-            txt_price = tag_price.get_text(separator=' ', strip=True) if tag_price else ""
+            tag_price = p.css_first('.price')
+            txt_price = tag_price.text(separator=' ', strip=True) if tag_price else ""
             p_min, p_max = get_precios(txt_price)
             
             # Empaquetado de datos iniciales
             datos_producto = {
                 'Categoría': nombre_cat, 
-                'Nombre': tag_a.get_text(strip=True),
+                'Nombre': nombre,
                 'Precio Mínimo (S/)': p_min, 
                 'Precio Máximo (S/)': p_max, 
                 'URL': url_prod
@@ -327,23 +494,29 @@ def procesar_categoria(url):
 
         # --- EJECUCIÓN PARALELA (MULTITHREADING) ---
         if tareas:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-                
-                # Mapas de tareas a workers y filtrado de resultados nulos
-                resultados = list(filter(None, ex.map(procesar_producto, tareas)))
-                
-                # Almacenamiento global
-                datos_recopilados.extend(resultados)
-                
-                print(f"   -> Página {page}: {len(resultados)} productos validados y guardados.")
+            # Enviamos las tareas al pool compartido sin esperar a que terminen,
+            # así la siguiente página se descarga mientras los workers procesan esta
+            futuros.extend(pool_productos.submit(procesar_producto, t) for t in tareas)
+            
+            print(f"   -> {nombre_cat} | Página {page}: {len(tareas)} productos enviados a los workers.")
         else:
-             print(f"   -> Página {page}: Todos los productos ya fueron procesados previamente.")
+             print(f"   -> {nombre_cat} | Página {page}: Sin productos nuevos que cumplan el filtro MINSA.")
 
         # Verificar si existe botón de "Siguiente" para continuar el bucle
-        if not soup.select_one('.next'): 
+        siguiente = soup.css_first('a.next, .next a')
+        if siguiente is None: 
             break
-            
+        
+        # Construcción de URL paginada: usamos el enlace del sitio tal cual,
+        # con la URL armada a mano como respaldo
+        current_url = siguiente.attributes.get('href') or f"{url}page/{page + 1}/"
         page += 1
+    
+    # Recogemos los resultados de toda la categoría según van terminando
+    # (los workers ya entregaron cada producto validado al hilo escritor)
+    # (las tareas canceladas por una interrupción no cuentan)
+    validados = sum(1 for f in concurrent.futures.as_completed(futuros) if not f.cancelled() and f.result())
+    print(f"   ✅ {nombre_cat}: {validados} productos validados y guardados.")
 
 
 # ==============================================================================
@@ -355,9 +528,20 @@ if __name__ == "__main__":
     # Inicio del cronómetro
     start = time.time()
     
+    # Opción --fresh: ignorar lo descargado en ejecuciones anteriores
+    if '--fresh' in sys.argv:
+        session.cache.clear()
+        print("🧹 Caché HTTP vaciada: se descargará todo de nuevo.")
+    
+    # Opción --incremental: omitir los productos ya procesados en ejecuciones anteriores
+    modo_incremental = '--incremental' in sys.argv
+    
     # 1. Cargar la base de datos de medicamentos
     cargar_filtro()
     
+    if modo_incremental:
+        cargar_vistas()
+    
     if lista_minsa:
         
         # 2. Descubrir categorías en el Home
@@ -365,43 +549,57 @@ if __name__ == "__main__":
         soup_home = get_soup(URL_HOME)
         
         # Selector CSS específico para el menú de categorías
-        if soup_home:
-            items_menu = soup_home.select('#menu-mega-menu-categorias li a[href*="/c/"]')
-            cats = [l['href'] for l in items_menu]
+        if soup_home is not None:
+            items_menu = soup_home.css('#menu-mega-menu-categorias li a[href*="/c/"]')
+            cats = [l.attributes['href'] for l in items_menu]
         else:
             cats = []
         
         if cats:
             print(f"🚀 SE HAN DETECTADO {len(cats)} CATEGORÍAS. INICIANDO SCRAPING MASIVO...")
             
-            # 3. Procesar cada categoría secuencialmente
-            for c in cats: 
-                procesar_categoria(c)
+            # 3. Arrancar el hilo escritor: los resultados se guardan a medida que llegan
+            # En modo incremental solo hay productos nuevos: van a un archivo aparte
+            # para no sobrescribir el reporte completo
+            if modo_incremental:
+                nombre_excel = f"catalogo_turbo_minsa_nuevos_{datetime.now():%Y%m%d_%H%M%S}.xlsx"
+            else:
+                nombre_excel = 'catalogo_turbo_minsa.xlsx'
+            escritor = threading.Thread(target=escritor_excel, args=(nombre_excel,))
+            escritor.start()
             
-            # 4. Exportación de Resultados
-            if datos_recopilados:
-                print("\n💾 Procesando archivo de salida...")
-                
-                df = pd.DataFrame(datos_recopilados)
-                
-                # --- LIMPIEZA FINAL DE SEGURIDAD ---
-                # Aunque filtramos en tiempo real, hacemos una pasada final
-                # para eliminar duplicados basados en URL.
-                cantidad_antes = len(df)
-                df.drop_duplicates(subset=['URL'], keep='first', inplace=True)
-                cantidad_despues = len(df)
+            # 4. Procesar las categorías en paralelo
+            pool_categorias = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+            try:
+                list(pool_categorias.map(procesar_categoria, cats))
+            except BaseException:
+                # Ctrl+C o error: se descartan las categorías y productos aún en cola
+                # y los que están en marcha se detienen en su siguiente paso
+                detener.set()
+                pool_categorias.shutdown(wait=False, cancel_futures=True)
+                pool_productos.shutdown(wait=False, cancel_futures=True)
+                raise
+            finally:
+                # Señal de fin para el escritor antes de cualquier espera: guarda lo recolectado
+                # incluso si hubo un error (los productos que terminen después se descartan)
+                cola_resultados.put(None)
                 
-                if cantidad_antes != cantidad_despues:
-                    print(f"   🧹 Se eliminaron {cantidad_antes - cantidad_despues} duplicados residuales.")
+                pool_categorias.shutdown()
+                pool_productos.shutdown()
+                escritor.join()
                 
-                # Guardado en Excel
-                nombre_excel = 'catalogo_turbo_minsa.xlsx'
-                df.to_excel(nombre_excel, index=False)
-                
-                # Reporte final
+                if modo_incremental:
+                    guardar_vistas()
+            
+            # Un fallo del hilo escritor no debe reportarse como éxito
+            if error_escritor is not None:
+                raise error_escritor
+            
+            # 5. Reporte final
+            if total_guardados:
                 mins_totales = (time.time() - start) / 60
                 print(f"\n🏁 ¡PROCESO COMPLETADO EN {mins_totales:.2f} MINUTOS!")
-                print(f"📊 Total productos únicos recolectados: {len(df)}")
+                print(f"📊 Total productos únicos recolectados: {total_guardados}")
                 print(f"📄 Archivo generado: {nombre_excel}")
                 
             else: 
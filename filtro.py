@@ -0,0 +1,95 @@
+"""
+Filtro MINSA: normalización de nombres y búsqueda de medicamentos.
+
+Es la única parte del bot que consume CPU (se ejecuta una vez por producto),
+por eso vive en un módulo aparte, escrito en Python válido y con tipos, para
+poder compilarlo opcionalmente a una extensión en C con mypyc:
+
+    pip install mypy
+    mypyc filtro.py
+
+Python carga automáticamente el .so generado en lugar de este archivo.
+Sin compilar, el comportamiento es idéntico.
+"""
+
+import unicodedata
+from functools import lru_cache
+
+import ahocorasick  # type: ignore
+
+
+# Tabla de traducción para quitar las tildes más comunes en una sola pasada (en C).
+# Se aplica después de upper(), por eso solo contiene mayúsculas.
+TABLA_ACENTOS = str.maketrans('ÁÉÍÓÚÜÑÀÈÌÒÙ', 'AEIOUUNAEIOU')
+
+# Autómata Aho-Corasick con todos los medicamentos (se arma en construir_automata)
+automata_minsa = ahocorasick.Automaton()
+
+
+@lru_cache(maxsize=100_000)
+def normalizar(txt: object) -> str:
+    """
+    Normaliza una cadena de texto para facilitar comparaciones insensibles a formato.
+    Los resultados se cachean: los nombres de producto se repiten entre páginas y variantes.
+
+    Proceso:
+    1. Convierte todo el texto a mayúsculas.
+    2. Elimina acentos y diacríticos (ej: Á -> A, ñ -> N). La vía rápida es str.translate;
+       solo si queda algún carácter no ASCII se recurre a la descomposición Unicode NFD.
+
+    Args:
+        txt (str): Texto original.
+
+    Returns:
+        str: Texto limpio y normalizado.
+    """
+    # Validación preventiva: si no es texto, retornar cadena vacía
+    if not isinstance(txt, str):
+        return ""
+
+    texto = txt.upper().translate(TABLA_ACENTOS)
+
+    # Vía rápida: el caso habitual (español) ya queda en ASCII
+    if texto.isascii():
+        return texto
+
+    # Respaldo para otros diacríticos (ej: Ç, Â): NFD separa el carácter base de su marca
+    # y descartamos las marcas diacríticas ('Mn')
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+
+def construir_automata(medicamentos: set) -> None:
+    """
+    Compila todos los medicamentos (ya normalizados) en un único autómata Aho-Corasick.
+
+    Args:
+        medicamentos (set): Nombres normalizados de la lista MINSA.
+    """
+    global automata_minsa
+
+    # Cada medicamento se registra rodeado de espacios para exigir palabras completas
+    automata = ahocorasick.Automaton()
+    for m in medicamentos:
+        automata.add_word(f" {m} ", m)
+    automata.make_automaton()
+
+    automata_minsa = automata
+
+
+def cumple_filtro(n: str) -> bool:
+    """
+    Determina si un producto de la web coincide con la lista del MINSA.
+
+    Args:
+        n (str): Nombre del producto ya normalizado con normalizar().
+
+    Returns:
+        bool: True si hay coincidencia, False en caso contrario.
+    """
+    # Un único recorrido del nombre (O(longitud), sin importar el tamaño de la lista)
+    # detecta cualquier medicamento contenido como palabra completa.
+    # Al rodear el nombre con espacios se cubren la coincidencia exacta, al inicio y en medio.
+    for _ in automata_minsa.iter(f" {n} "):
+        return True
+
+    return False